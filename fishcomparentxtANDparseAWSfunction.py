@@ -1,173 +1,518 @@
-import os
-import hashlib
-import requests
-from twilio.rest import Client
-import logging
-import time
-import boto3
-import pdfplumber
-
-# Set up logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-# Initialize S3 client
-s3_client = boto3.client('s3')
-
-# Proxy configuration function
-def get_pdf_with_proxy(url, proxies=None):
-    """
-    Fetch a PDF from a URL using an optional proxy.
-    :param url: The URL to fetch the PDF from.
-    :param proxies: Dictionary of proxies to use (if any).
-    :return: response object
-    """
-    try:
-        response = requests.get(url, proxies=proxies)
-        response.raise_for_status()  # Raise an error for bad HTTP status codes
-        return response
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching PDF through proxy: {e}")
-        return None
-
-# Extract relevant information from the PDF
-def parse_pdf(file_content):
-    """
-    Parse the PDF content to extract the relevant data.
-    :param file_content: PDF content as bytes.
-    :return: List of extracted data (Date, Water, City/Town, Species, QTY, Size)
-    """
-    extracted_data = []
-    try:
-        with pdfplumber.open(file_content) as pdf:
-            # Loop through each page and extract text
-            for page in pdf.pages:
-                # Extract table data
-                table = page.extract_tables()
-                for row in table:
-                    if len(row) >= 6:  # Make sure we have all expected columns
-                        # Example row structure: [Date, Water, City/Town, Species, QTY, Size]
-                        extracted_data.append({
-                            "Date": row[0],
-                            "Water": row[1],
-                            "City/Town": row[2],
-                            "Species": row[3],
-                            "QTY": row[4],
-                            "Size": row[5]
-                        })
-    except Exception as e:
-        logger.error(f"Error parsing PDF: {e}")
-    return extracted_data
-
-# Lambda handler function
-def lambda_handler(event, context):
-    # Twilio credentials from environment variables
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')  # Store in Lambda environment variables
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')    # Store in Lambda environment variables
-    twilio_number = os.getenv('TWILIO_PHONE_NUMBER')  # Store in Lambda environment variables
-
-    # Recipient phone number
-    to_number = os.getenv('TO_PHONE_NUMBER')  # Store in Lambda environment variables
-
-    # File URL and S3 URL for the expected hash file
-    file_url = 'https://www.maine.gov/ifw/docs/current_stocking_report.pdf'
-    s3_hash_file_url = 'https://fishstock.s3.us-east-2.amazonaws.com/fishstockhash.txt'
-    s3_bucket = 'fishstock'  # S3 bucket name
-    s3_hash_file_key = 'fishstockhash.txt'  # S3 key for the hash file
-
-    # List of proxy URLs (set as environment variables)
-    proxy_urls = os.getenv('PROXY_URLS').split(',')  # Assuming a comma-separated list of proxies
-
-    # Fetch the expected hash from the S3 URL
-    try:
-        response = requests.get(s3_hash_file_url)
-        response.raise_for_status()  # Raise an error for bad HTTP status codes
-        expected_hash = response.text.strip().upper()  # Read hash from file and strip any extra whitespace
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching expected hash from S3: {e}")
-        return
-
-    # Iterate over the proxies in the list
-    for proxy_url in proxy_urls:
-        proxies = {
-            "http": proxy_url,
-            "https": proxy_url
-        }
-
-        # Retry 5 times with each proxy
-        for attempt in range(5):
-            logger.info(f"Attempt {attempt + 1} of 5 with proxy: {proxy_url}")
-            response = get_pdf_with_proxy(file_url, proxies)
-            if response and response.status_code == 200:
-                file_content = response.content
-
-                # Calculate the SHA256 hash of the file
-                file_hash = hashlib.sha256(file_content).hexdigest().upper()
-
-                # Check if the file hash matches the expected hash
-                if file_hash != expected_hash:
-                    logger.info(f"Hash mismatch detected. Current hash: {file_hash}, Expected hash: {expected_hash}")
-
-                    # Upload new hash to S3
-                    try:
-                        # Delete the old hash file from S3
-                        s3_client.delete_object(Bucket=s3_bucket, Key=s3_hash_file_key)
-                        logger.info("Deleted old hash file from S3.")
-
-                        # Create new hash file content
-                        new_hash_content = file_hash + "\n"  # Write the new hash to the file
-
-                        # Upload the new hash file to S3
-                        s3_client.put_object(Bucket=s3_bucket, Key=s3_hash_file_key, Body=new_hash_content)
-                        logger.info(f"Uploaded new hash file to S3 with hash: {file_hash}")
-                    except Exception as e:
-                        logger.error(f"Error updating hash file in S3: {e}")
-                        return  # Exit function if updating the hash file fails
-
-                    # Extract data from PDF
-                    extracted_data = parse_pdf(file_content)
-
-                    # Create Twilio client
-                    client = Client(account_sid, auth_token)
-
-                    # Send SMS for each entry in the extracted data
-                    for entry in extracted_data:
-                        # Format the message body
-                        message_body = (
-                            f"Hello, Fish stalker letting you know that on {entry['Date']}, "
-                            f"the Water in {entry['City/Town']} was stalked with {entry['QTY']} "
-                            f"{entry['Size']} inch of {entry['Species']}. Good luck and tight lines!"
-                        )
-
-                        # Send SMS
-                        try:
-                            message = client.messages.create(
-                                body=message_body,
-                                from_=twilio_number,
-                                to=to_number
-                            )
-
-                            # Log message SID to confirm message sent
-                            logger.info(f"Message SID: {message.sid}")
-                        except Exception as e:
-                            logger.error(f"Error sending SMS: {e}")
-
-                    return  # Exit function after sending the SMS
-
-                else:
-                    logger.info("No file change detected.")
-                    return  # Exit function since no change was detected
-
-            # If the request fails, log the failure and retry after a brief wait
-            logger.error(f"Attempt {attempt + 1} failed with proxy: {proxy_url}")
-            time.sleep(5)  # Wait for 5 seconds before retrying
-
-        # If all retries failed for this proxy, try the next proxy
-        logger.error(f"All retries failed for proxy: {proxy_url}")
-
-    # If all proxies fail, log and return
-    logger.error("All proxies have failed after 5 attempts each. No successful file fetch.")
-    return {
-        'statusCode': 500,
-        'body': 'Lambda function completed with failure.'
-    }
+import os
+import random
+import requests
+from blake3 import blake3
+import threading
+import time
+import concurrent.futures
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from io import BytesIO
+from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+import logging
+import boto3
+from botocore.exceptions import ClientError
+import fitz  # PyMuPDF
+import pdfplumber
+
+# Read the PDF in 100 KiB chunks so hashing overlaps the download
+CHUNK_SIZE = 100 * 1024
+
+# pdfminer is CPU-bound; fork workers to parse pages in parallel.
+# Capped at 2 since the Lambda only gets a couple of vCPUs.
+MAX_PARSE_WORKERS = min(os.cpu_count() or 1, 2)
+
+# The stocking report draws its table with ruled lines; naming the
+# strategy up front lets pdfplumber skip its per-page auto-detection
+# (which falls back through the pricier lines+text combinations)
+TABLE_SETTINGS = {
+    "vertical_strategy": "lines",
+    "horizontal_strategy": "lines"
+}
+
+# Give up on a proxy if it can't connect in 3s or stalls for 10s mid-read
+REQUEST_TIMEOUT = (3, 10)
+
+# Don't wait longer than this for any proxy to come back with the PDF
+PROXY_RACE_TIMEOUT = 30
+
+# Number of parallel byte-range requests used to pull the PDF body
+RANGE_PARTS = 4
+
+# Column order of the stocking-report table; extracted data is kept as
+# parallel lists under these names rather than one dict per row, which
+# skips the ~232-byte dict overhead and key lookups per row
+COLUMNS = ("Date", "Water", "City/Town", "Species", "QTY", "Size")
+
+# Twilio caps long-code numbers at 1 message per second; send through a
+# thread pool but pace the actual creates with a shared token bucket
+MAX_SMS_WORKERS = 20
+SMS_PER_SECOND = 1
+SMS_MAX_RETRIES = 5
+
+# SMS message templates, frozen at import so the format strings aren't
+# re-parsed from f-string bytecode on every row
+SMS_DETAIL_TEMPLATE = "on {Date} with {QTY} {Size} inch of {Species}"
+SMS_MESSAGE_TEMPLATE = (
+    "Hello, Fish stalker letting you know that {Water} in {City/Town} "
+    "was stalked {details}. Good luck and tight lines!"
+)
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Initialize S3 client
+s3_client = boto3.client('s3')
+
+# Twilio client and config live at module scope so warm Lambda
+# invocations reuse the client's HTTPS connection pool instead of
+# re-reading env vars and re-handshaking with api.twilio.com
+TWILIO = Client(os.environ['TWILIO_ACCOUNT_SID'], os.environ['TWILIO_AUTH_TOKEN'])
+TWILIO_FROM = os.environ['TWILIO_PHONE_NUMBER']  # Twilio number to send from
+TO_NUMBER = os.environ['TO_PHONE_NUMBER']  # Recipient phone number
+
+# List of proxy URLs (comma-separated, parsed once per container)
+PROXY_URLS = os.environ['PROXY_URLS'].split(',')
+
+# One session for the whole container: keep-alive reuses warm TLS
+# connections across requests (and across warm Lambda invocations)
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5)
+)
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+
+# Proxy configuration function
+def get_pdf_with_proxy(url, proxies=None, headers=None):
+    """
+    Fetch a PDF from a URL using an optional proxy.
+    :param url: The URL to fetch the PDF from.
+    :param proxies: Dictionary of proxies to use (if any).
+    :param headers: Extra request headers, e.g. conditional-fetch headers.
+    :return: streamed response object (body not yet read)
+    """
+    try:
+        response = SESSION.get(url, proxies=proxies, headers=headers, stream=True, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()  # Raise an error for bad HTTP status codes
+        return response
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error fetching PDF through proxy: {e}")
+        return None
+
+# Close a losing proxy attempt's response once it lands
+def _close_response(future):
+    """
+    Done-callback for losing race attempts: close the response (if the
+    attempt produced one) so its connection goes back to the pool.
+    :param future: Completed future from the proxy race.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    response = future.result()
+    if response is not None:
+        response.close()
+
+# Race all proxies at once instead of trying them one at a time
+def fetch_pdf_via_proxies(url, proxy_urls, headers=None):
+    """
+    Fire the PDF request through every proxy concurrently and return the
+    first successful response, cancelling the slower attempts.
+    :param url: The URL to fetch the PDF from.
+    :param proxy_urls: List of proxy URLs to race.
+    :param headers: Extra request headers passed through to each attempt.
+    :return: (response, proxies) for the first response with status 200
+             (or 304 if the conditional headers matched); (None, None)
+             if all proxies fail.
+    """
+    # No `with` here: exiting the context manager would wait for every
+    # in-flight attempt, blocking the "first proxy wins" return until
+    # the slowest straggler times out
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(proxy_urls))
+    futures = {
+        pool.submit(get_pdf_with_proxy, url, {"http": p, "https": p}, headers): p
+        for p in proxy_urls
+    }
+    winning_future = None
+    result = (None, None)
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=PROXY_RACE_TIMEOUT):
+            response = future.result()
+            if response and response.status_code in (200, 304):
+                winner = futures[future]
+                logger.info(f"Proxy won the race: {winner}")
+                winning_future = future
+                result = (response, {"http": winner, "https": winner})
+                break
+            # A response with a losing status still holds a connection
+            if response is not None:
+                response.close()
+            logger.error(f"Proxy failed: {futures[future]}")
+    except concurrent.futures.TimeoutError:
+        logger.error(f"No proxy responded within {PROXY_RACE_TIMEOUT} seconds.")
+    finally:
+        # Hand back immediately: cancel what never started, let the
+        # stragglers finish in the background, and close their responses
+        # as they land so the keep-alive connections aren't leaked
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future in futures:
+            if future is not winning_future:
+                future.add_done_callback(_close_response)
+    return result
+
+# Pull the PDF body, in parallel byte-range slices when possible
+def download_pdf_body(url, response, proxies=None):
+    """
+    Read the PDF body from the winning response. When the origin
+    advertises Accept-Ranges: bytes and a known length, drop the single
+    stream and fetch the body as parallel byte-range slices into one
+    preallocated buffer, which saturates bandwidth better than one
+    connection. Otherwise drain the stream as before.
+    :param url: URL the response came from.
+    :param response: Streamed 200 response for that URL.
+    :param proxies: Proxy dict to route the range requests through.
+    :return: PDF body as bytes, or None if the download fails.
+    """
+    try:
+        content_length = int(response.headers.get('Content-Length') or 0)
+        if response.headers.get('Accept-Ranges') != 'bytes' or content_length <= CHUNK_SIZE:
+            return b"".join(response.iter_content(chunk_size=CHUNK_SIZE))
+
+        # The ranged fetches replace the stream, so release it first
+        response.close()
+        buffer = bytearray(content_length)
+        part_size = -(-content_length // RANGE_PARTS)  # Ceiling division
+
+        def fetch_range(start):
+            end = min(start + part_size, content_length) - 1
+            part = SESSION.get(
+                url,
+                proxies=proxies,
+                headers={'Range': f'bytes={start}-{end}'},
+                timeout=REQUEST_TIMEOUT
+            )
+            part.raise_for_status()
+            # Proxies routinely strip Range and answer 200 with the full
+            # body; splicing a wrong-sized slice would silently resize the
+            # shared buffer and corrupt it, so insist on a real partial
+            if part.status_code != 206 or len(part.content) != end - start + 1:
+                raise requests.exceptions.RequestException(
+                    f"Expected 206 partial of {end - start + 1} bytes, "
+                    f"got {part.status_code} with {len(part.content)} bytes"
+                )
+            buffer[start:end + 1] = part.content
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=RANGE_PARTS) as pool:
+                for future in [pool.submit(fetch_range, s) for s in range(0, content_length, part_size)]:
+                    future.result()
+            return bytes(buffer)
+        except requests.exceptions.RequestException as e:
+            # A slice failed; refetch the whole body over one stream
+            logger.warning(f"Range download failed, refetching as one stream: {e}")
+            retry = SESSION.get(url, proxies=proxies, stream=True, timeout=REQUEST_TIMEOUT)
+            retry.raise_for_status()
+            return b"".join(retry.iter_content(chunk_size=CHUNK_SIZE))
+    except requests.exceptions.RequestException as e:
+        # A reset or timeout mid-body shouldn't crash the invocation
+        logger.error(f"Error downloading PDF body: {e}")
+        return None
+
+# Shared pacing for the SMS thread pool
+class SmsRateLimiter:
+    """
+    Hand out send slots one per 1/rate seconds across all threads so the
+    pool never exceeds Twilio's per-number message rate.
+    """
+    def __init__(self, per_second):
+        self._interval = 1.0 / per_second
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait_for_slot(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+# Send a single SMS, retrying on Twilio rate-limit responses
+def send_sms(client, from_number, to_number, message_body, limiter):
+    """
+    Send one SMS through Twilio, honoring the shared rate limit and
+    backing off with jitter when Twilio answers 429 (error 20429).
+    :param client: Twilio client to send with.
+    :param from_number: Twilio number to send from.
+    :param to_number: Recipient phone number.
+    :param message_body: Text of the message.
+    :param limiter: Shared SmsRateLimiter pacing the sends.
+    """
+    for attempt in range(SMS_MAX_RETRIES):
+        limiter.wait_for_slot()
+        try:
+            message = client.messages.create(
+                body=message_body,
+                from_=from_number,
+                to=to_number
+            )
+
+            # Log message SID to confirm message sent
+            logger.info(f"Message SID: {message.sid}")
+            return
+        except TwilioRestException as e:
+            if e.status == 429:
+                # Exponential backoff with jitter before trying again
+                backoff = min(30, 2 ** attempt) + random.random()
+                logger.warning(f"Twilio rate limit hit, retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+                continue
+            logger.error(f"Error sending SMS: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Error sending SMS: {e}")
+            return
+    logger.error("Giving up on SMS after repeated rate-limit responses.")
+
+# Fresh set of parallel column lists
+def _new_columns():
+    """Return an empty column store: one list per column name."""
+    return {name: [] for name in COLUMNS}
+
+# Append raw table rows onto the parallel column lists
+def _append_table_rows(table_rows, columns):
+    """
+    Append valid table rows to the column store, skipping rows that are
+    too short.
+    :param table_rows: Iterable of row lists from a table extractor.
+    :param columns: Column store to append to.
+    """
+    for row in table_rows:
+        if len(row) >= 6:  # Make sure we have all expected columns
+            # Example row structure: [Date, Water, City/Town, Species, QTY, Size]
+            for name, value in zip(COLUMNS, row):
+                columns[name].append(value)
+
+# Slow-path fallback when MuPDF finds no table on a page
+def _parse_page_fallback(file_bytes, page_number, columns):
+    """
+    Re-parse a single page with pdfplumber, for pages where MuPDF's
+    find_tables comes back empty.
+    :param file_bytes: Full PDF content as bytes.
+    :param page_number: 1-based page number to re-parse.
+    :param columns: Column store to append to.
+    """
+    with pdfplumber.open(BytesIO(file_bytes), pages=[page_number]) as pdf:
+        for page in pdf.pages:
+            table = page.extract_table(TABLE_SETTINGS)
+            if table:
+                _append_table_rows(table, columns)
+
+# Worker for parse_pdf: runs in a separate process
+def _parse_page_range(file_bytes, page_numbers):
+    """
+    Parse one contiguous range of pages from the PDF. MuPDF (fitz) is a
+    C binding and parses far faster than the pure-Python pdfminer stack,
+    so it takes the first pass; pdfplumber stays as a fallback.
+    :param file_bytes: Full PDF content as bytes.
+    :param page_numbers: 1-based page numbers this worker should handle.
+    :return: Column store with the rows for those pages, in order.
+    """
+    columns = _new_columns()
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        for page_number in page_numbers:
+            tables = doc[page_number - 1].find_tables()
+            if tables.tables:
+                for table in tables:
+                    _append_table_rows(table.extract(), columns)
+            else:
+                _parse_page_fallback(file_bytes, page_number, columns)
+    return columns
+
+# Extract relevant information from the PDF
+def parse_pdf(file_bytes):
+    """
+    Parse the PDF content to extract the relevant data, splitting the
+    pages across worker processes (pdfminer holds the GIL, so threads
+    wouldn't help here).
+    :param file_bytes: PDF content as bytes.
+    :return: Column store of extracted data (Date, Water, City/Town,
+             Species, QTY, Size as parallel lists)
+    """
+    extracted_data = _new_columns()
+    try:
+        # Open once just to count pages, then split the page range
+        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+            num_pages = doc.page_count
+        workers = max(1, min(MAX_PARSE_WORKERS, num_pages))
+        chunk_size = -(-num_pages // workers)  # Ceiling division
+        page_ranges = [
+            list(range(start, min(start + chunk_size, num_pages + 1)))
+            for start in range(1, num_pages + 1, chunk_size)
+        ]
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                # map() yields results in submission order, so rows stay ordered
+                for chunk_columns in pool.map(_parse_page_range, [file_bytes] * len(page_ranges), page_ranges):
+                    for name in COLUMNS:
+                        extracted_data[name].extend(chunk_columns[name])
+        except OSError as e:
+            # Lambda has no /dev/shm, so multiprocessing can't create its
+            # semaphores and the pool dies at startup; parse every page
+            # in this process instead of dropping the data
+            logger.warning(f"Process pool unavailable ({e}); parsing serially.")
+            extracted_data = _parse_page_range(file_bytes, list(range(1, num_pages + 1)))
+    except Exception as e:
+        logger.error(f"Error parsing PDF: {e}")
+    return extracted_data
+
+# Lambda handler function
+def lambda_handler(event, context):
+    # File URL and S3 location of the expected hash file
+    file_url = 'https://www.maine.gov/ifw/docs/current_stocking_report.pdf'
+    s3_bucket = 'fishstock'  # S3 bucket name
+    s3_hash_file_key = 'fishstockhash.txt'  # S3 key for the hash file
+
+    # Fetch the expected hash straight through the S3 client — same warm
+    # connection pool as the later put_object, and boto3 signs and
+    # retries for us. The PDF's ETag and Last-Modified from the previous
+    # run ride along as object metadata.
+    try:
+        obj = s3_client.get_object(Bucket=s3_bucket, Key=s3_hash_file_key)
+        expected_hash = obj['Body'].read().decode().strip().upper()
+        hash_file_etag = obj['ETag']  # Pins the conditional write later
+        stored_etag = obj['Metadata'].get('pdf-etag', '')
+        stored_last_modified = obj['Metadata'].get('pdf-last-modified', '')
+    except Exception as e:
+        logger.error(f"Error fetching expected hash from S3: {e}")
+        return
+
+    # Cheap pre-check: HEAD the PDF and compare ETags before downloading
+    # anything. On the common no-change path this skips the whole transfer.
+    if stored_etag:
+        try:
+            head = SESSION.head(file_url, timeout=REQUEST_TIMEOUT)
+            if head.ok and head.headers.get('ETag', '') == stored_etag:
+                logger.info("PDF ETag unchanged; skipping download.")
+                return
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"HEAD pre-check failed, falling back to full fetch: {e}")
+
+    # Conditional headers let the origin (or a proxy) answer 304 with no body
+    conditional_headers = {}
+    if stored_etag:
+        conditional_headers['If-None-Match'] = stored_etag
+    if stored_last_modified:
+        conditional_headers['If-Modified-Since'] = stored_last_modified
+
+    # Race all proxies concurrently and take the first that answers
+    response, winning_proxies = fetch_pdf_via_proxies(file_url, PROXY_URLS, conditional_headers)
+    if response:
+        if response.status_code == 304:
+            logger.info("PDF not modified (304); skipping download.")
+            return
+
+        # Pull the body (parallel byte ranges when the origin supports
+        # them, one stream otherwise) and hash it for the change check
+        file_bytes = download_pdf_body(file_url, response, winning_proxies)
+        if file_bytes is None:
+            # The race was won but the body never arrived in full; fail
+            # the invocation cleanly like an all-proxies miss
+            logger.error("PDF body download failed. No successful file fetch.")
+            return {
+                'statusCode': 500,
+                'body': 'Lambda function completed with failure.'
+            }
+        file_hash = "BLAKE3:" + blake3(file_bytes).hexdigest().upper()
+
+        # Check if the file hash matches the expected hash
+        if file_hash != expected_hash:
+            logger.info(f"Hash mismatch detected. Current hash: {file_hash}, Expected hash: {expected_hash}")
+
+            # Extract data from PDF before persisting the new hash: if
+            # parsing dies here, the old hash stays in S3 and the next
+            # invocation retries instead of the change being swallowed
+            extracted_data = parse_pdf(file_bytes)
+
+            # Upload new hash to S3 in one conditional write. IfMatch pins
+            # the put to the version we read, so two concurrent
+            # invocations can't silently stomp each other's update.
+            new_hash_content = file_hash + "\n"  # Write the new hash to the file
+            put_kwargs = {
+                'Bucket': s3_bucket,
+                'Key': s3_hash_file_key,
+                'Body': new_hash_content,
+                # The PDF's ETag/Last-Modified ride along for the next pre-check
+                'Metadata': {
+                    'pdf-etag': response.headers.get('ETag', ''),
+                    'pdf-last-modified': response.headers.get('Last-Modified', '')
+                }
+            }
+            try:
+                try:
+                    s3_client.put_object(IfMatch=hash_file_etag, **put_kwargs)
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'PreconditionFailed':
+                        raise
+                    # Lost a race with another invocation: re-read the
+                    # current version and retry the conditional write once
+                    logger.warning("Hash file changed underneath us; retrying conditional write.")
+                    current = s3_client.get_object(Bucket=s3_bucket, Key=s3_hash_file_key)
+                    s3_client.put_object(IfMatch=current['ETag'], **put_kwargs)
+                logger.info(f"Uploaded new hash file to S3 with hash: {file_hash}")
+            except Exception as e:
+                logger.error(f"Error updating hash file in S3: {e}")
+                return  # Exit function if updating the hash file fails
+
+            # Coalesce entries for the same water body into a single
+            # message so each stocked water costs one send (and fewer
+            # billable segments) instead of one send per table row.
+            # The column store is indexed by row number.
+            rows_by_water = {}
+            for i in range(len(extracted_data["Date"])):
+                rows_by_water.setdefault(extracted_data["Water"][i], []).append(i)
+
+            message_bodies = []
+            for water, row_indices in rows_by_water.items():
+                details = "; ".join(
+                    SMS_DETAIL_TEMPLATE.format_map({
+                        "Date": extracted_data["Date"][i],
+                        "QTY": extracted_data["QTY"][i],
+                        "Size": extracted_data["Size"][i],
+                        "Species": extracted_data["Species"][i]
+                    })
+                    for i in row_indices
+                )
+                message_bodies.append(SMS_MESSAGE_TEMPLATE.format_map({
+                    "Water": water,
+                    "City/Town": extracted_data["City/Town"][row_indices[0]],
+                    "details": details
+                }))
+
+            # Fan the sends out over a thread pool; the shared limiter
+            # keeps the actual creates at Twilio's per-number rate
+            limiter = SmsRateLimiter(SMS_PER_SECOND)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_SMS_WORKERS) as pool:
+                futures = [
+                    pool.submit(send_sms, TWILIO, TWILIO_FROM, TO_NUMBER, body, limiter)
+                    for body in message_bodies
+                ]
+                concurrent.futures.wait(futures)
+
+            return  # Exit function after sending the SMS
+
+        else:
+            logger.info("No file change detected.")
+            return  # Exit function since no change was detected
+
+    # If all proxies fail, log and return
+    logger.error("All proxies have failed. No successful file fetch.")
+    return {
+        'statusCode': 500,
+        'body': 'Lambda function completed with failure.'
+    }
@@ -1,129 +1,205 @@
-import os
-import hashlib
-import requests
-from twilio.rest import Client
-import logging
-import time
-import boto3
-
-# Set up logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-# Initialize S3 client
-s3_client = boto3.client('s3')
-
-# Proxy configuration function
-def get_pdf_with_proxy(url, proxies=None):
-    """
-    Fetch a PDF from a URL using an optional proxy.
-    :param url: The URL to fetch the PDF from.
-    :param proxies: Dictionary of proxies to use (if any).
-    :return: response object
-    """
-    try:
-        response = requests.get(url, proxies=proxies)
-        response.raise_for_status()  # Raise an error for bad HTTP status codes
-        return response
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching PDF through proxy: {e}")
-        return None
-
-# Lambda handler function
-def lambda_handler(event, context):
-    # Twilio credentials from environment variables
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')  # Store in Lambda environment variables
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')    # Store in Lambda environment variables
-    twilio_number = os.getenv('TWILIO_PHONE_NUMBER')  # Store in Lambda environment variables
-
-    # Recipient phone number
-    to_number = os.getenv('TO_PHONE_NUMBER')  # Store in Lambda environment variables
-
-    # File URL and S3 URL for the expected hash file
-    file_url = 'https://www.maine.gov/ifw/docs/current_stocking_report.pdf'
-    s3_hash_file_url = 'https://fishstock.s3.us-east-2.amazonaws.com/fishstockhash.txt'
-    s3_bucket = 'fishstock'  # S3 bucket name
-    s3_hash_file_key = 'fishstockhash.txt'  # S3 key for the hash file
-
-    # List of proxy URLs (set as environment variables)
-    proxy_urls = os.getenv('PROXY_URLS').split(',')  # Assuming a comma-separated list of proxies
-
-    # Fetch the expected hash from the S3 URL
-    try:
-        response = requests.get(s3_hash_file_url)
-        response.raise_for_status()  # Raise an error for bad HTTP status codes
-        expected_hash = response.text.strip().upper()  # Read hash from file and strip any extra whitespace
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching expected hash from S3: {e}")
-        return
-
-    # Iterate over the proxies in the list
-    for proxy_url in proxy_urls:
-        proxies = {
-            "http": proxy_url,
-            "https": proxy_url
-        }
-
-        # Retry 5 times with each proxy
-        for attempt in range(5):
-            logger.info(f"Attempt {attempt + 1} of 5 with proxy: {proxy_url}")
-            response = get_pdf_with_proxy(file_url, proxies)
-            if response and response.status_code == 200:
-                file_content = response.content
-
-                # Calculate the SHA256 hash of the file
-                file_hash = hashlib.sha256(file_content).hexdigest().upper()
-
-                # Check if the file hash matches the expected hash
-                if file_hash != expected_hash:
-                    logger.info(f"Hash mismatch detected. Current hash: {file_hash}, Expected hash: {expected_hash}")
-
-                    # Upload new hash to S3
-                    try:
-                        # Delete the old hash file from S3
-                        s3_client.delete_object(Bucket=s3_bucket, Key=s3_hash_file_key)
-                        logger.info("Deleted old hash file from S3.")
-
-                        # Create new hash file content
-                        new_hash_content = file_hash + "\n"  # Write the new hash to the file
-
-                        # Upload the new hash file to S3
-                        s3_client.put_object(Bucket=s3_bucket, Key=s3_hash_file_key, Body=new_hash_content)
-                        logger.info(f"Uploaded new hash file to S3 with hash: {file_hash}")
-                    except Exception as e:
-                        logger.error(f"Error updating hash file in S3: {e}")
-                        return  # Exit function if updating the hash file fails
-
-                    # Create Twilio client
-                    client = Client(account_sid, auth_token)
-
-                    # Send SMS
-                    try:
-                        message = client.messages.create(
-                            body="Hello, this is the Fish Stalker letting you know that a new body of water has been stocked",
-                            from_=twilio_number,
-                            to=to_number
-                        )
-
-                        # Log message SID to confirm message sent
-                        logger.info(f"Message SID: {message.sid}")
-                    except Exception as e:
-                        logger.error(f"Error sending SMS: {e}")
-                    return  # Exit function after successful SMS send
-                else:
-                    logger.info("No file change detected.")
-                    return  # Exit function since no change was detected
-
-            # If the request fails, log the failure and retry after a brief wait
-            logger.error(f"Attempt {attempt + 1} failed with proxy: {proxy_url}")
-            time.sleep(5)  # Wait for 5 seconds before retrying
-
-        # If all retries failed for this proxy, try the next proxy
-        logger.error(f"All retries failed for proxy: {proxy_url}")
-
-    # If all proxies fail, log and return
-    logger.error("All proxies have failed after 5 attempts each. No successful file fetch.")
-    return {
-        'statusCode': 500,
-        'body': 'Lambda function completed with failure.'
-    }
+import os
+import asyncio
+import random
+import aiohttp
+from blake3 import blake3
+from twilio.rest import Client
+import logging
+import boto3
+from botocore.exceptions import ClientError
+
+# Read the PDF in 100 KiB chunks so hashing overlaps the download
+CHUNK_SIZE = 100 * 1024
+
+# Give up on a proxy if it can't connect in 3s or stalls for 10s mid-read
+CLIENT_TIMEOUT = aiohttp.ClientTimeout(connect=3, sock_read=10)
+
+# How many times to re-race the proxy list before giving up
+MAX_FETCH_ATTEMPTS = 5
+
+# Cap the backoff between retries
+MAX_BACKOFF = 30
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Initialize S3 client
+s3_client = boto3.client('s3')
+
+# Twilio client and config live at module scope so warm Lambda
+# invocations reuse the client's HTTPS connection pool instead of
+# re-reading env vars and re-handshaking with api.twilio.com
+TWILIO = Client(os.environ['TWILIO_ACCOUNT_SID'], os.environ['TWILIO_AUTH_TOKEN'])
+TWILIO_FROM = os.environ['TWILIO_PHONE_NUMBER']  # Twilio number to send from
+TO_NUMBER = os.environ['TO_PHONE_NUMBER']  # Recipient phone number
+
+# List of proxy URLs (comma-separated, parsed once per container)
+PROXY_URLS = os.environ['PROXY_URLS'].split(',')
+
+# Fetch the PDF through one proxy, hashing the body as it streams
+async def fetch_and_hash(session, url, proxy, headers):
+    """
+    Fetch the PDF through a single proxy and hash it incrementally.
+    :param session: Shared aiohttp session.
+    :param url: The URL to fetch the PDF from.
+    :param proxy: Proxy URL to route through.
+    :param headers: Conditional-fetch headers (if any).
+    :return: (status_code, file_hash, response headers); file_hash is
+             None for a 304. Raises on connection/HTTP errors so the
+             race can discard this proxy.
+    """
+    async with session.get(url, proxy=proxy, headers=headers) as response:
+        if response.status == 304:
+            return 304, None, response.headers
+        response.raise_for_status()
+        file_hash_obj = blake3()
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            file_hash_obj.update(chunk)
+        return response.status, "BLAKE3:" + file_hash_obj.hexdigest().upper(), response.headers
+
+# Race every proxy at once and keep the first finisher
+async def race_proxies(session, url, headers):
+    """
+    Start a fetch through every proxy concurrently and return the first
+    one that completes, cancelling the rest.
+    :param session: Shared aiohttp session.
+    :param url: The URL to fetch the PDF from.
+    :param headers: Conditional-fetch headers (if any).
+    :return: (status_code, file_hash, response headers), or
+             (None, None, None) if every proxy failed.
+    """
+    tasks = [
+        asyncio.create_task(fetch_and_hash(session, url, proxy, headers))
+        for proxy in PROXY_URLS
+    ]
+    try:
+        for future in asyncio.as_completed(tasks):
+            try:
+                return await future
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Proxy attempt failed: {e}")
+    finally:
+        # First finisher wins; abandon the stragglers
+        for task in tasks:
+            task.cancel()
+    return None, None, None
+
+# Async body of the handler: overlaps all the network I/O on one loop
+async def _run():
+    # File URL and S3 location of the expected hash file
+    file_url = 'https://www.maine.gov/ifw/docs/current_stocking_report.pdf'
+    s3_bucket = 'fishstock'  # S3 bucket name
+    s3_hash_file_key = 'fishstockhash.txt'  # S3 key for the hash file
+
+    # Fetch the expected hash straight through the S3 client — same warm
+    # connection pool as the later put_object, and boto3 signs and
+    # retries for us. The PDF's ETag and Last-Modified from the previous
+    # run ride along as object metadata.
+    try:
+        obj = s3_client.get_object(Bucket=s3_bucket, Key=s3_hash_file_key)
+        expected_hash = obj['Body'].read().decode().strip().upper()
+        hash_file_etag = obj['ETag']  # Pins the conditional write later
+        stored_etag = obj['Metadata'].get('pdf-etag', '')
+        stored_last_modified = obj['Metadata'].get('pdf-last-modified', '')
+    except Exception as e:
+        logger.error(f"Error fetching expected hash from S3: {e}")
+        return
+
+    connector = aiohttp.TCPConnector(limit=32)
+    async with aiohttp.ClientSession(connector=connector, timeout=CLIENT_TIMEOUT) as session:
+        # Cheap pre-check: HEAD the PDF and compare ETags before downloading
+        # anything. On the common no-change path this skips the whole transfer.
+        if stored_etag:
+            try:
+                async with session.head(file_url) as head:
+                    if head.ok and head.headers.get('ETag', '') == stored_etag:
+                        logger.info("PDF ETag unchanged; skipping download.")
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"HEAD pre-check failed, falling back to full fetch: {e}")
+
+        # Conditional headers let the origin (or a proxy) answer 304 with no body
+        conditional_headers = {}
+        if stored_etag:
+            conditional_headers['If-None-Match'] = stored_etag
+        if stored_last_modified:
+            conditional_headers['If-Modified-Since'] = stored_last_modified
+
+        # Race the proxy list, re-racing with backoff if every proxy fails
+        status = file_hash = pdf_headers = None
+        for attempt in range(MAX_FETCH_ATTEMPTS):
+            status, file_hash, pdf_headers = await race_proxies(session, file_url, conditional_headers)
+            if status is not None:
+                break
+            # Back off exponentially with jitter so concurrent
+            # invocations don't retry in lockstep
+            logger.error(f"Fetch attempt {attempt + 1} of {MAX_FETCH_ATTEMPTS} failed on all proxies.")
+            await asyncio.sleep(min(MAX_BACKOFF, 2 ** attempt) + random.random())
+
+    if status is None:
+        # If all proxies fail, log and return
+        logger.error("All proxies have failed. No successful file fetch.")
+        return {
+            'statusCode': 500,
+            'body': 'Lambda function completed with failure.'
+        }
+
+    if status == 304:
+        logger.info("PDF not modified (304); skipping download.")
+        return
+
+    # Check if the file hash matches the expected hash
+    if file_hash != expected_hash:
+        logger.info(f"Hash mismatch detected. Current hash: {file_hash}, Expected hash: {expected_hash}")
+
+        # Upload new hash to S3 in one conditional write. IfMatch
+        # pins the put to the version we read, so two concurrent
+        # invocations can't silently stomp each other's update.
+        new_hash_content = file_hash + "\n"  # Write the new hash to the file
+        put_kwargs = {
+            'Bucket': s3_bucket,
+            'Key': s3_hash_file_key,
+            'Body': new_hash_content,
+            # The PDF's ETag/Last-Modified ride along for the next pre-check
+            'Metadata': {
+                'pdf-etag': pdf_headers.get('ETag', ''),
+                'pdf-last-modified': pdf_headers.get('Last-Modified', '')
+            }
+        }
+        try:
+            try:
+                s3_client.put_object(IfMatch=hash_file_etag, **put_kwargs)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'PreconditionFailed':
+                    raise
+                # Lost a race with another invocation: re-read the
+                # current version and retry the conditional write once
+                logger.warning("Hash file changed underneath us; retrying conditional write.")
+                current = s3_client.get_object(Bucket=s3_bucket, Key=s3_hash_file_key)
+                s3_client.put_object(IfMatch=current['ETag'], **put_kwargs)
+            logger.info(f"Uploaded new hash file to S3 with hash: {file_hash}")
+        except Exception as e:
+            logger.error(f"Error updating hash file in S3: {e}")
+            return  # Exit function if updating the hash file fails
+
+        # Send SMS through the module-scope Twilio client
+        try:
+            message = TWILIO.messages.create(
+                body="Hello, this is the Fish Stalker letting you know that a new body of water has been stocked",
+                from_=TWILIO_FROM,
+                to=TO_NUMBER
+            )
+
+            # Log message SID to confirm message sent
+            logger.info(f"Message SID: {message.sid}")
+        except Exception as e:
+            logger.error(f"Error sending SMS: {e}")
+        return  # Exit function after successful SMS send
+    else:
+        logger.info("No file change detected.")
+        return  # Exit function since no change was detected
+
+# Lambda handler function
+def lambda_handler(event, context):
+    return asyncio.run(_run())
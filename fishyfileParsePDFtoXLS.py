@@ -1,73 +1,140 @@
+import os
 import requests
-import pdfplumber
+import fitz  # PyMuPDF
 import pandas as pd
-from io import BytesIO
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 
-# Fetch the PDF from the provided URL
-pdf_url = "https://www.maine.gov/ifw/docs/2024%20Annual%20Fish%20Stocking%20Report.pdf"
-response = requests.get(pdf_url)
-
-# Ensure the request was successful
-if response.status_code != 200:
-    raise Exception(f"Failed to fetch the PDF, status code {response.status_code}")
-
-# Open the PDF from the response content
-with pdfplumber.open(BytesIO(response.content)) as pdf:
-    all_data = []
-    current_county = None
-
-    # Loop through the pages and extract the text
-    for page_number, page in enumerate(pdf.pages, start=1):
-        text = page.extract_text()
-
-        # For debugging purposes, print out the first 500 characters of the text on each page
-        # print(f"--- Page {page_number} ---")
-        # print(text[:500])
-
-        # Search for the county name, accounting for instances where "REPORT" precedes the county
-        county_matches = re.findall(r'(?:REPORT\s+)?(\w+\s?\w+)\s+County', text)
-
-        # Check if we found a county name
-        if county_matches:
-            current_county = county_matches[-1]  # Get the last county found (if multiple counties are mentioned)
-
-        # Split the text into lines and process each line
-        lines = text.split('\n')
-
-        for line in lines:
-            # Match the structure: DATE WATER City/Town SPECIES QUANTITY SIZE (in inches)
-            match = re.match(r'(\d{1,2}/\d{1,2}/\d{4})\s+([A-Za-z\s]+)\s+([A-Za-z\s]+)\s+([A-Za-z\s]+)\s+(\d+)\s+(\d+)', line)
-
-            if match:
-                date = match.group(1)  # The date (MM/DD/YYYY)
-                water = match.group(2)  # The water body (e.g., ANDROSCOGGIN R)
-                city_town = match.group(3)  # City/Town (e.g., LISBON)
-                species = match.group(4)  # Species (e.g., BROOK TROUT)
-                quantity = match.group(5)  # Quantity (e.g., 300)
-                size = match.group(6)  # Size (inches, e.g., 10)
-
-                # Add the entry to the list, including the county if it exists
-                if current_county:
-                    all_data.append([current_county, date, water, city_town, species, quantity, size])
-
-# Check if any data was extracted
-if not all_data:
-    raise ValueError("No data extracted from the PDF.")
-
-# Convert to a pandas DataFrame
-df = pd.DataFrame(all_data, columns=["County", "DATE", "WATER", "City/Town", "Species", "QTY", "SIZE"])
-
-# Create a new Excel writer object
-with pd.ExcelWriter("Fish_Stocking_Report_by_County.xlsx", engine='openpyxl') as writer:
-    # Check if the DataFrame contains any data
-    if not df.empty:
-        # Group by "County" and save each group in its own sheet
-        for county, group in df.groupby("County"):
-            # Ensure that sheet names are 31 characters or less
-            sheet_name = county[:31]
-            group.to_excel(writer, sheet_name=sheet_name, index=False)
-    else:
-        raise ValueError("No valid data to write to Excel.")
-
-print("Excel file has been created successfully.")
+# One session with keep-alive and retries instead of a bare requests.get
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5)))
+
+# PDF text extraction is CPU-bound, so fork worker processes to split the page load
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Row structure: DATE WATER City/Town SPECIES QUANTITY SIZE (in inches).
+# Compiled once, anchored per line, with non-greedy uppercase groups so the
+# engine can't backtrack across the ambiguous word/whitespace runs.
+ROW_RE = re.compile(
+    r'(?m)^(\d{1,2}/\d{1,2}/\d{4})\s+([A-Z][A-Z\s]+?)\s+([A-Z][A-Z\s]+?)\s+([A-Z][A-Z\s]+?)\s+(\d+)\s+(\d+)\s*$'
+)
+
+# County header, accounting for instances where "REPORT" precedes the
+# county. Only horizontal whitespace is allowed around the name so the
+# capture can't reach across a newline and swallow the tail of the
+# previous line when scanning the joined document text.
+COUNTY_RE = re.compile(r'(?:REPORT[ \t]+)?(\w+[ \t]?\w+)[ \t]+County')
+
+# Output column order; rows are collected as parallel lists under these
+# names so the DataFrame is built column-wise, without a dict per row
+COLUMN_NAMES = ("County", "DATE", "WATER", "City/Town", "Species", "QTY", "SIZE")
+
+
+def extract_page_lines(file_bytes, page_numbers):
+    """Worker: extract each page's text as a list of line strings.
+
+    Lines come straight out of MuPDF's structured text dict, so no
+    full-page string is ever built and then re-split on newlines.
+    """
+    pages = []
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        for n in page_numbers:
+            lines = []
+            for block in doc[n - 1].get_text("dict")["blocks"]:
+                for line in block.get("lines", []):
+                    lines.append("".join(span["text"] for span in line["spans"]))
+            pages.append(lines)
+    return pages
+
+
+def main():
+    # Fetch the PDF from the provided URL
+    pdf_url = "https://www.maine.gov/ifw/docs/2024%20Annual%20Fish%20Stocking%20Report.pdf"
+    response = SESSION.get(pdf_url)
+
+    # Ensure the request was successful
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch the PDF, status code {response.status_code}")
+
+    file_bytes = response.content
+
+    # Open the PDF once just to count pages, then split the page range across workers
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        num_pages = doc.page_count
+
+    workers = max(1, min(MAX_WORKERS, num_pages))
+    chunk_size = -(-num_pages // workers)  # Ceiling division
+    page_ranges = [
+        list(range(start, min(start + chunk_size, num_pages + 1)))
+        for start in range(1, num_pages + 1, chunk_size)
+    ]
+
+    # Extract page lines in parallel; map() keeps the pages in order
+    page_lines = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for pages in pool.map(extract_page_lines, [file_bytes] * len(page_ranges), page_ranges):
+            page_lines.extend(pages)
+
+    col_data = {name: [] for name in COLUMN_NAMES}
+
+    # Join everything into one string and let the regex engine make a
+    # single linear scan over it, instead of looping pages and lines in
+    # Python. Counties are resolved afterwards by offset.
+    all_text = "\n".join(line for lines in page_lines for line in lines)
+
+    # Map each county header to its character offset, once
+    county_boundaries = [(m.start(), m.group(1)) for m in COUNTY_RE.finditer(all_text)]
+    county_starts = [offset for offset, _ in county_boundaries]
+
+    # One pass for the data rows; each row belongs to the nearest county
+    # header above it, found by binary search on the offsets
+    for match in ROW_RE.finditer(all_text):
+        boundary_index = bisect_right(county_starts, match.start()) - 1
+        if boundary_index >= 0:
+            county = county_boundaries[boundary_index][1]
+            # Groups: date, water body, city/town, species, quantity, size
+            for name, value in zip(COLUMN_NAMES, (county, *match.groups())):
+                col_data[name].append(value)
+
+    # Check if any data was extracted
+    if not col_data["County"]:
+        raise ValueError("No data extracted from the PDF.")
+
+    # Convert to a pandas DataFrame (column-wise construction skips the
+    # row-to-column transpose over Python objects)
+    df = pd.DataFrame(col_data)
+
+    # Shrink memory before grouping/serialization: categorical County keeps
+    # one copy of each name instead of one per row, and real int/datetime
+    # dtypes are smaller and faster for openpyxl to write than strings
+    df["County"] = df["County"].astype("category")
+    df[["QTY", "SIZE"]] = df[["QTY", "SIZE"]].astype("int32")
+    df["DATE"] = pd.to_datetime(df["DATE"], format="%m/%d/%Y")
+
+    # Create a new Excel writer object. xlsxwriter is several times
+    # faster than openpyxl for row-heavy sheets. constant_memory mode is
+    # deliberately NOT used: pandas emits body cells column-by-column,
+    # and constant_memory silently discards writes to already-flushed
+    # rows, corrupting every sheet
+    with pd.ExcelWriter("Fish_Stocking_Report_by_County.xlsx", engine='xlsxwriter') as writer:
+        # Check if the DataFrame contains any data
+        if not df.empty:
+            # Group by "County" and save each group in its own sheet;
+            # sort=False/observed=True skips re-sorting the categorical
+            for county, group in df.groupby("County", sort=False, observed=True):
+                # Ensure that sheet names are 31 characters or less
+                sheet_name = county[:31]
+                group.to_excel(writer, sheet_name=sheet_name, index=False)
+                # Drop this group's copy before materializing the next one
+                del group
+        else:
+            raise ValueError("No valid data to write to Excel.")
+
+    print("Excel file has been created successfully.")
+
+
+if __name__ == "__main__":
+    main()